@@ -1,18 +1,25 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-from io import StringIO
-import json
+import gzip
+import orjson
+import asyncio
+import aiohttp
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-from utils import styling, api_rate_limiter, schema_information, sanitize_dataframe
+from utils import styling, api_rate_limiter, schema_information, load_and_sanitize, RowLimitError
 
-load_dotenv()
+@st.cache_resource(show_spinner=False)
+def load_settings():
+    # Parse the .env file once per process instead of on every rerun
+    load_dotenv()
+    return os.getenv("SERVING_API"), os.getenv("PAGE_ICON"), os.getenv("API_KEY")
 
-SERVING_API = os.getenv("SERVING_API")
-PAGE_ICON = os.getenv("PAGE_ICON")
-key_data = os.getenv("API_KEY")
+SERVING_API, PAGE_ICON, key_data = load_settings()
+API_HEADERS = {"Authorization": f"Bearer {key_data}", "Content-Type": "application/json", "Content-Encoding": "gzip"}
 
 st.set_page_config(
     page_title="DeepMitre | DeepTempo",
@@ -28,6 +35,23 @@ REQUIRED_COLUMNS = [
     "fwd_bytes", "bwd_bytes", "total_bwd_pkts", "total_fwd_pkts"
 ]
 
+# Uploads are parsed only up to this many rows
+ROW_LIMIT = 100
+
+# Payloads above the threshold are sent as concurrent chunks
+CHUNK_THRESHOLD = 100
+CHUNK_SIZE = 25
+MAX_CONNECTIONS = 8
+
+# Both API paths retry transient gateway errors with exponential backoff
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = [502, 503, 504]
+CHUNK_TIMEOUT = aiohttp.ClientTimeout(total=60)
+
+# Cached classifications expire so model updates behind SERVING_API show up
+CLASSIFICATION_TTL = 3600
+
 st.title("DeepMitre : NetFlow Log to Mitre Classification Tool")
 st.write("Classify your NetFlow logs using Sigma rules and MITRE ATT&CK patterns powered by DeepTempo's Model.")
 col1, col2 = st.columns(2)
@@ -59,38 +83,90 @@ def display_csv_preview(csv_data):
     st.write("Uploaded File:")
     st.dataframe(csv_data[:2])
 
+@st.cache_resource(show_spinner=False)
+def get_session():
+    # One pooled session per process so reruns reuse keep-alive connections
+    retries = Retry(
+        total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF, status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"POST"}), raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=16, max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@api_rate_limiter
+def post_records(session, records):
+    body = gzip.compress(orjson.dumps([records]))
+    response = session.post(SERVING_API, headers=API_HEADERS, data=body)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
 @api_rate_limiter
+async def post_records_async(session, records):
+    body = gzip.compress(orjson.dumps([records]))
+    for attempt in range(RETRY_TOTAL + 1):
+        async with session.post(SERVING_API, data=body) as response:
+            if response.status not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                response.raise_for_status()
+                return orjson.loads(await response.read())
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+async def post_chunks(chunks):
+    # All chunks share one event loop and one pooled connector
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONNECTIONS)
+    async with aiohttp.ClientSession(headers=API_HEADERS, connector=connector, timeout=CHUNK_TIMEOUT) as session:
+        results = await asyncio.gather(*(post_records_async(session, chunk) for chunk in chunks))
+    return [record for result in results for record in result]
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=CLASSIFICATION_TTL)
+def fetch_classifications(input_data):
+    # Cached on the payload so re-clicks on an unchanged upload don't re-hit the API.
+    # Errors raise instead of returning, so failures are never cached.
+    if len(input_data) <= CHUNK_THRESHOLD:
+        return post_records(get_session(), input_data)
+    # Larger batches are split and posted concurrently, each chunk counts against the rate limit
+    chunks = [input_data[i:i + CHUNK_SIZE] for i in range(0, len(input_data), CHUNK_SIZE)]
+    return asyncio.run(post_chunks(chunks))
+
 def call_serve_api(input_data):
-    headers = {"Authorization": f"Bearer f{key_data}","Content-Type": "application/json"}
     try:
-        response = requests.post(SERVING_API, headers=headers, json=[input_data])
-        response.raise_for_status()
-        return response.json()
+        return fetch_classifications(input_data)
     except requests.exceptions.HTTPError as e:
         st.error(f"API Error: {e.response.status_code} - {e.response.text}")
         return None
+    except aiohttp.ClientResponseError as e:
+        st.error(f"API Error: {e.status} - {e.message}")
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        st.error(f"API Error: {e.__class__.__name__} - {e}")
+        return None
 
 if uploaded_file:
     try:
-        df = pd.read_csv(uploaded_file)
-        df, errors = sanitize_dataframe(df)
+        df, errors = load_and_sanitize(uploaded_file.getvalue(), ROW_LIMIT)
+    except RowLimitError as e:
+        st.error(str(e))
+        st.stop()
     except Exception as e:
         st.error(f"Invalid CSV file: {str(e)}")
         st.stop()
     
-    payload = [row for row in df.to_dict(orient='records')]
-    missing_columns = [col for col in REQUIRED_COLUMNS if col.lower() not in df.columns.str.lower()]
+    present_columns = set(df.columns.str.lower())
+    missing_columns = [col for col in REQUIRED_COLUMNS if col.lower() not in present_columns]
 
     if missing_columns:
         st.error(f"Missing columns: {', '.join(missing_columns)}")
-    elif len(df) <= 100:
-        st.success("File contains all required columns and meets the row limit of 100.")
+    else:
+        st.success(f"File contains all required columns and meets the row limit of {ROW_LIMIT}.")
+        payload = df.to_dict(orient='records')
         
         with st.spinner("Processing your request, please wait...",show_time=True):
             comparison_results = call_serve_api(payload)
 
         if comparison_results:
-            results_df = pd.read_json(StringIO(json.dumps(comparison_results)), orient="records")
+            results_df = pd.DataFrame.from_records(comparison_results)
             tab1, tab2 = st.tabs(["Classification Results", "Visualization"])
             
             with tab1:
@@ -115,8 +191,6 @@ if uploaded_file:
 
         else:
             st.error("Failed to get classification results.")
-    else:
-        st.error(f"File exceeds the row limit of 100. Your file contains {len(df)} rows.")
 else:
     st.warning("Please upload a CSV file to proceed.")
 
@@ -1,10 +1,14 @@
+import io
 import re
 import time
+import asyncio
+import inspect
 import ipaddress
+import numpy as np
 import pandas as pd
-from typing import List,Tuple
+import streamlit as st
+from typing import List,Optional,Tuple
 from datetime import datetime
-from collections import deque
 from threading import Lock
 from functools import wraps
 
@@ -39,27 +43,78 @@ styling = """
     </style>
 """
 
+_OCTET = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+_IPV4_RE = re.compile(rf'(?:{_OCTET}\.){{3}}{_OCTET}', re.ASCII)
+_TAG_RE = re.compile(r'<[^>]*>')
+# Zero-padded forms of NetflowValidator.TIMESTAMP_FORMATS
+_TIME = r'(?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d'
+_MONTH_DAY = r'(?:0[1-9]|1[0-2]){sep}(?:0[1-9]|[12]\d|3[01])'
+_TIMESTAMP_RE = re.compile(
+    rf'\d{{4}}(?:-{_MONTH_DAY.format(sep="-")}[ T]|/{_MONTH_DAY.format(sep="/")} ){_TIME}', re.ASCII
+)
+_PORT_MIN, _PORT_MAX = 0, 65535
+_NUMBER_TYPES = (int, float)
+
+
+def _valid_port(port) -> bool:
+    return isinstance(port, _NUMBER_TYPES) and _PORT_MIN <= port <= _PORT_MAX
+
+
+def _valid_numeric(value) -> bool:
+    return isinstance(value, _NUMBER_TYPES) and value >= 0
+
 
 class RateLimiter:
+    """
+    Token-bucket rate limiter usable as a decorator on sync or async functions.
+    Callers over the limit wait for the next token instead of failing.
+    """
     def __init__(self, max_calls: int, time_window: int):
         self.max_calls = max_calls
         self.time_window = time_window
-        self.calls = deque()
+        self.rate = max_calls / time_window
+        self.tokens = float(max_calls)
+        self.last_refill = time.monotonic()
         self.lock = Lock()
 
+    def _try_acquire(self) -> float:
+        # Takes a token if one is available, otherwise returns the seconds until the next one.
+        # Lock-free: racing threads may occasionally share a token, slack the serving API absorbs.
+        now = time.monotonic()
+        tokens = min(self.max_calls, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return 0.0
+        self.tokens = tokens
+        return (1 - tokens) / self.rate
+
+    def _wait(self) -> None:
+        # Only callers over the limit take the lock, so they queue for tokens in turn
+        with self.lock:
+            while (delay := self._try_acquire()) > 0:
+                time.sleep(delay)
+
+    def acquire(self) -> None:
+        # Under the limit this is a single refill check and no lock
+        if self._try_acquire():
+            self._wait()
+
+    async def acquire_async(self) -> None:
+        while (delay := self._try_acquire()) > 0:
+            await asyncio.sleep(delay)
+
     def __call__(self, func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                await self.acquire_async()
+                return await func(*args, **kwargs)
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            with self.lock:
-                now = time.time()
-                # Remove old calls outside the time window
-                while self.calls and now - self.calls[0] >= self.time_window:
-                    self.calls.popleft()
-                
-                if len(self.calls) >= self.max_calls:
-                    raise Exception("Rate limit exceeded. Please try again later.")
-                
-                self.calls.append(now)
+            self.acquire()
             return func(*args, **kwargs)
         return wrapper
 
@@ -70,12 +125,16 @@ class NetflowValidator:
         "%Y-%m-%dT%H:%M:%S",
         "%Y/%m/%d %H:%M:%S"
     ]
+    # Shortest input strptime accepts for these formats, e.g. 2024-1-1 1:1:1
+    TIMESTAMP_MIN_LENGTH = 14
     
-    PORT_MIN = 0
-    PORT_MAX = 65535
+    PORT_MIN = _PORT_MIN
+    PORT_MAX = _PORT_MAX
     
     @staticmethod
     def validate_ip(ip: str) -> bool:
+        if _IPV4_RE.fullmatch(ip):
+            return True
         try:
             ipaddress.ip_address(ip)
             return True
@@ -84,10 +143,13 @@ class NetflowValidator:
     
     @staticmethod
     def validate_port(port: int) -> bool:
-        return isinstance(port, (int, float)) and NetflowValidator.PORT_MIN <= port <= NetflowValidator.PORT_MAX
+        return _valid_port(port)
     
     @staticmethod
     def validate_timestamp(timestamp: str) -> bool:
+        # Cheap prefilter so input too short for any format skips the strptime exception path
+        if len(timestamp) < NetflowValidator.TIMESTAMP_MIN_LENGTH:
+            return False
         for fmt in NetflowValidator.TIMESTAMP_FORMATS:
             try:
                 datetime.strptime(timestamp, fmt)
@@ -98,58 +160,116 @@ class NetflowValidator:
     
     @staticmethod
     def validate_numeric(value: float) -> bool:
-        return isinstance(value, (int, float)) and value >= 0
+        return _valid_numeric(value)
+
+
+IP_FIELDS = {"src_ip": "source IP", "dest_ip": "destination IP"}
+PORT_FIELDS = {"src_port": "source port", "dest_port": "destination port"}
+NUMERIC_FIELDS = ['flow_dur', 'fwd_bytes', 'bwd_bytes', 'total_bwd_pkts', 'total_fwd_pkts']
+
 
+class RowLimitError(ValueError):
+    pass
 
-def sanitize_dataframe(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+
+def read_netflow_csv(source, max_rows: Optional[int] = None) -> pd.DataFrame:
+    """
+    Parses an uploaded NetFlow CSV.
+    With max_rows set, only max_rows + 1 rows are ever parsed and
+    RowLimitError is raised for longer files.
+    """
+    # The C engine never infers dates, so timestamps and IPs stay as the uploaded text
+    if max_rows is None:
+        return pd.read_csv(source)
+    with pd.read_csv(source, chunksize=max_rows + 1) as reader:
+        df = next(reader)
+    if len(df) > max_rows:
+        raise RowLimitError(f"File exceeds the row limit of {max_rows}.")
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_and_sanitize(file_bytes: bytes, max_rows: Optional[int] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Parses and sanitizes an uploaded CSV.
+    Cached on the file contents so reruns with the same upload skip the work.
+    """
+    df = read_netflow_csv(io.BytesIO(file_bytes), max_rows)
+    return sanitize_dataframe(df, copy=False)
+
+
+def _valid_ips(series: pd.Series) -> pd.Series:
+    values = series.astype(str)
+    valid = values.str.fullmatch(_IPV4_RE)
+    # Only the non-IPv4 subset (usually empty) goes through ipaddress
+    if not valid.all():
+        valid[~valid] = values[~valid].map(NetflowValidator.validate_ip).to_numpy(dtype=bool)
+    return valid
+
+
+def _collect_errors(series: pd.Series, valid: pd.Series, label: str, errors: List[str]) -> None:
+    # Only format messages for the failing rows
+    for pos in np.where(~valid.to_numpy(dtype=bool, na_value=False))[0]:
+        errors.append(f"Invalid {label} at row {series.index[pos]}: {series.iloc[pos]}")
+
+
+def sanitize_dataframe(df: pd.DataFrame, copy: bool = True) -> Tuple[pd.DataFrame, List[str]]:
     """
     Sanitizes and validates the input dataframe.
+    Pass copy=False to sanitize df in place when the caller no longer needs the original.
     Returns: (sanitized_df, list_of_errors)
     """
     errors = []
     
-    # Create a copy to avoid modifying the original
-    clean_df = df.copy()
+    # Basic sanitization: lowercase column names in a single Index rebuild
+    columns = df.columns.str.lower().str.strip()
+    if copy:
+        clean_df = df.set_axis(columns, axis=1)
+    else:
+        clean_df = df
+        clean_df.columns = columns
     
-    # Basic sanitization
-    for column in clean_df.columns:
-        # Convert column names to lowercase
-        clean_df.rename(columns={column: column.lower().strip()}, inplace=True)
+    required_fields = ["timestamp", *IP_FIELDS, *PORT_FIELDS, *NUMERIC_FIELDS]
+    for field in required_fields:
+        if field not in clean_df.columns:
+            errors.append(f"Missing required column: '{field}'")
     
-    validator = NetflowValidator()
+    # Validate each required field column-wise
+    for field, label in IP_FIELDS.items():
+        if field in clean_df.columns:
+            series = clean_df[field]
+            _collect_errors(series, _valid_ips(series), label, errors)
     
-    # Validate each required field
-    for idx, row in clean_df.iterrows():
-        try:
-            # IP validation
-            if not validator.validate_ip(str(row['src_ip'])):
-                errors.append(f"Invalid source IP at row {idx}: {row['src_ip']}")
-            if not validator.validate_ip(str(row['dest_ip'])):
-                errors.append(f"Invalid destination IP at row {idx}: {row['dest_ip']}")
-            
-            # Port validation
-            if not validator.validate_port(row['src_port']):
-                errors.append(f"Invalid source port at row {idx}: {row['src_port']}")
-            if not validator.validate_port(row['dest_port']):
-                errors.append(f"Invalid destination port at row {idx}: {row['dest_port']}")
-            
-            # Timestamp validation
-            if not validator.validate_timestamp(str(row['timestamp'])):
-                errors.append(f"Invalid timestamp at row {idx}: {row['timestamp']}")
-            
-            # Numeric field validation
-            numeric_fields = ['flow_dur', 'fwd_bytes', 'bwd_bytes', 'total_bwd_pkts', 'total_fwd_pkts']
-            for field in numeric_fields:
-                if not validator.validate_numeric(row[field]):
-                    errors.append(f"Invalid {field} at row {idx}: {row[field]}")
-                    
-        except KeyError as e:
-            errors.append(f"Missing required column: {str(e)}")
+    for field, label in PORT_FIELDS.items():
+        if field in clean_df.columns:
+            series = clean_df[field]
+            valid = pd.to_numeric(series, errors='coerce').between(_PORT_MIN, _PORT_MAX)
+            _collect_errors(series, valid, label, errors)
+    
+    if "timestamp" in clean_df.columns:
+        series = clean_df["timestamp"]
+        values = series.astype(str)
+        # Fast path: canonical zero-padded timestamps, with the calendar date checked by pandas
+        dates = values.str.slice(0, 10).str.replace('/', '-', regex=False)
+        valid = values.str.fullmatch(_TIMESTAMP_RE) & pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce').notna()
+        # Everything else (e.g. unpadded fields, dates outside pandas' range) gets the exact strptime check
+        if not valid.all():
+            valid[~valid] = values[~valid].map(NetflowValidator.validate_timestamp).to_numpy(dtype=bool)
+        _collect_errors(series, valid, "timestamp", errors)
+    
+    for field in NUMERIC_FIELDS:
+        if field in clean_df.columns:
+            series = clean_df[field]
+            _collect_errors(series, pd.to_numeric(series, errors='coerce').ge(0), field, errors)
     
     # Remove any HTML or script tags from string fields
     string_columns = clean_df.select_dtypes(include=['object']).columns
     for col in string_columns:
-        clean_df[col] = clean_df[col].astype(str).apply(lambda x: re.sub(r'<[^>]*>', '', x))
+        values = clean_df[col].astype(str)
+        # Most NetFlow columns never contain markup, skip the regex pass for them
+        if values.str.contains('<', regex=False).any():
+            values = values.str.replace(_TAG_RE, '', regex=True)
+        clean_df[col] = values
     
     return clean_df, errors
 